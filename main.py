@@ -1,91 +1,134 @@
-import random
+from multiprocessing import Pool
+import numpy as np
 # En main.py
 from map_generator.terrain import generate_comprehensive_map, plot_maps, save_detailed_map, get_terrain_info
 import matplotlib.pyplot as plt
 
+# Energy is stored as int16; growing, ageing and eating saturate at these limits instead of wrapping around
+MAX_ENERGY = np.iinfo(np.int16).max
+MIN_ENERGY = np.iinfo(np.int16).min
+MAX_AGE = np.iinfo(np.uint16).max
+DAYS = 10  # Length of a simulation run
 
 class Organism:
-    def __init__(self, energy=100):
-        self.energy = energy
-    
+    # A whole population: one entry per organism in each state array
+    def __init__(self, count=0, energy=100):
+        self.energy = np.full(count, energy, dtype=np.int16)
+
+    def __len__(self):
+        return self.energy.size
+
     def is_alive(self):
         return self.energy > 0
 
+    def keep(self, mask):
+        self.energy = self.energy[mask]
+
+    def remove_dead(self):
+        self.keep(self.is_alive())
+
 class Plant(Organism):
     def grow(self):
+        np.minimum(self.energy, MAX_ENERGY - 5, out=self.energy)
         self.energy += 5  # Plants gain energy (grow) every turn
 
 class Animal(Organism):
-    def __init__(self, energy=100):
-        super().__init__(energy)
-        self.age = 0
-    
+    def __init__(self, count=0, energy=100):
+        super().__init__(count, energy)
+        self.age = np.zeros(count, dtype=np.uint16)
+
+    def keep(self, mask):
+        super().keep(mask)
+        self.age = self.age[mask]
+
     def age_one_year(self):
+        np.minimum(self.age, MAX_AGE - 1, out=self.age)
         self.age += 1
+        np.maximum(self.energy, MIN_ENERGY + 1, out=self.energy)
         self.energy -= 1  # Animals lose energy as they age
 
     def can_reproduce(self):
         return self.energy >= 50
 
     def reproduce(self):
-        if self.can_reproduce():
-            self.energy -= 25  # Energy cost of reproduction
-            return type(self)(energy=50)  # A new animal is born with 50 energy
-        else:
-            return None
+        parents = self.can_reproduce()
+        self.energy[parents] -= 25  # Energy cost of reproduction
+        newborns = np.count_nonzero(parents)
+        self.energy = np.concatenate([self.energy, np.full(newborns, 50, dtype=self.energy.dtype)])  # A new animal is born with 50 energy
+        self.age = np.concatenate([self.age, np.zeros(newborns, dtype=self.age.dtype)])
+
+    def hunt(self, prey, rng):
+        """Each animal picks a random prey; when several pick the same one, the first picker eats it."""
+        if not len(prey):
+            return
+        choices = rng.integers(0, len(prey), size=len(self))  # One batched draw for the whole population
+        # A stable sort groups predators by prey while keeping pick order, so the first of each group eats
+        order = np.argsort(choices, kind='stable')
+        sorted_choices = choices[order]
+        first = np.empty(order.size, dtype=bool)
+        first[:1] = True
+        np.not_equal(sorted_choices[1:], sorted_choices[:-1], out=first[1:])
+        picked, first_picker = sorted_choices[first], order[first]
+        alive = prey.is_alive()[picked]
+        picked, first_picker = picked[alive], first_picker[alive]
+        # The predator gains the energy of its prey, summed in int32 and clipped to the int16 range before storing back
+        gained = self.energy[first_picker].astype(np.int32) + prey.energy[picked]
+        self.energy[first_picker] = np.clip(gained, None, MAX_ENERGY)
+        prey.energy[picked] = 0  # The prey is consumed
+        prey.remove_dead()
 
 class Herbivore(Animal):
-    def eat(self, plant):
-        if plant.is_alive():
-            self.energy += plant.energy  # The herbivore gains the energy of the plant
-            plant.energy = 0  # The plant is consumed
+    def eat(self, plants, rng):
+        self.hunt(plants, rng)
 
 class Carnivore(Animal):
-    def eat(self, herbivore):
-        if herbivore.is_alive():
-            self.energy += herbivore.energy
-            herbivore.energy = 0  # The herbivore is consumed
+    def eat(self, herbivores, rng):
+        self.hunt(herbivores, rng)
+
+def simulation(seed=None, days=DAYS):
+    rng = np.random.default_rng(seed)
 
-def simulation():
     # Initialization of the ecosystem with 2 herbivores, 1 carnivore, and 5 plants
-    herbivores = [Herbivore() for _ in range(2)]
-    carnivores = [Carnivore() for _ in range(1)]
-    plants = [Plant() for _ in range(5)]
+    herbivores = Herbivore(count=2)
+    carnivores = Carnivore(count=1)
+    plants = Plant(count=5)
     
-    results = []
+    # Daily population counts, one row per day: herbivores, carnivores, plants
+    counts = np.zeros((days, 3), dtype=np.int32)
     
-    for day in range(1, 11):  # Simulate 10 days
-        day_result = f"--- Day {day} ---\n"
-        
+    for day in range(days):
         # Plants grow
-        for plant in plants:
-            plant.grow()
+        plants.grow()
         
         # Herbivores randomly eat plants and can reproduce
-        for herbivore in herbivores[:]:
-            if plants:
-                chosen_plant = random.choice(plants)
-                herbivore.eat(chosen_plant)
-                plants = [plant for plant in plants if plant.energy > 0]
-            herbivore.age_one_year()
-            if herbivore.can_reproduce():
-                herbivores.append(herbivore.reproduce())
+        herbivores.eat(plants, rng)
+        herbivores.age_one_year()
+        herbivores.reproduce()
         
         # Carnivores randomly eat herbivores and can reproduce
-        for carnivore in carnivores[:]:
-            if herbivores:
-                chosen_herbivore = random.choice(herbivores)
-                carnivore.eat(chosen_herbivore)
-                herbivores = [herbivore for herbivore in herbivores if herbivore.energy > 0]
-            carnivore.age_one_year()
-            if carnivore.can_reproduce():
-                carnivores.append(carnivore.reproduce())
+        carnivores.eat(herbivores, rng)
+        carnivores.age_one_year()
+        carnivores.reproduce()
 
         # Daily summary
-        day_result += f"Herbivores alive: {len(herbivores)}, Carnivores alive: {len(carnivores)}, Plants alive: {len(plants)}"
-        results.append(day_result)
+        counts[day] = len(herbivores), len(carnivores), len(plants)
     
-    return results
+    return counts
+
+def format_results(counts):
+    # Human-readable daily summaries, built once from the counts returned by simulation()
+    return [f"--- Day {day} ---\nHerbivores alive: {herbivores}, Carnivores alive: {carnivores}, Plants alive: {plants}"
+            for day, (herbivores, carnivores, plants) in enumerate(counts.tolist(), start=1)]
+
+def run_batch(n_replicas, seeds=None, processes=None):
+    # Independent replicas of the simulation, one per seed, spread over worker processes
+    if seeds is None:
+        seeds = np.random.SeedSequence().spawn(n_replicas)
+    seeds = list(seeds)
+    if len(seeds) != n_replicas:
+        raise ValueError(f"Expected {n_replicas} seeds, got {len(seeds)}")
+    with Pool(processes) as pool:
+        return pool.map(simulation, seeds)
 
 if __name__ == "__main__":
 
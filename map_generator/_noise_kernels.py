@@ -0,0 +1,87 @@
+import numpy as np
+from numba import njit, prange
+
+
+# Ken Perlin's reference permutation table, doubled to avoid index wrapping
+_PERM = np.array([
+    151, 160, 137, 91, 90, 15, 131, 13, 201, 95, 96, 53, 194, 233, 7, 225,
+    140, 36, 103, 30, 69, 142, 8, 99, 37, 240, 21, 10, 23, 190, 6, 148,
+    247, 120, 234, 75, 0, 26, 197, 62, 94, 252, 219, 203, 117, 35, 11, 32,
+    57, 177, 33, 88, 237, 149, 56, 87, 174, 20, 125, 136, 171, 168, 68, 175,
+    74, 165, 71, 134, 139, 48, 27, 166, 77, 146, 158, 231, 83, 111, 229, 122,
+    60, 211, 133, 230, 220, 105, 92, 41, 55, 46, 245, 40, 244, 102, 143, 54,
+    65, 25, 63, 161, 1, 216, 80, 73, 209, 76, 132, 187, 208, 89, 18, 169,
+    200, 196, 135, 130, 116, 188, 159, 86, 164, 100, 109, 198, 173, 186, 3, 64,
+    52, 217, 226, 250, 124, 123, 5, 202, 38, 147, 118, 126, 255, 82, 85, 212,
+    207, 206, 59, 227, 47, 16, 58, 17, 182, 189, 28, 42, 223, 183, 170, 213,
+    119, 248, 152, 2, 44, 154, 163, 70, 221, 153, 101, 155, 167, 43, 172, 9,
+    129, 22, 39, 253, 19, 98, 108, 110, 79, 113, 224, 232, 178, 185, 112, 104,
+    218, 246, 97, 228, 251, 34, 242, 193, 238, 210, 144, 12, 191, 179, 162, 241,
+    81, 51, 145, 235, 249, 14, 239, 107, 49, 192, 214, 31, 181, 199, 106, 157,
+    184, 84, 204, 176, 115, 121, 50, 45, 127, 4, 150, 254, 138, 236, 205, 93,
+    222, 114, 67, 29, 24, 72, 243, 141, 128, 195, 78, 66, 215, 61, 156, 180,
+] * 2, dtype=np.int64)
+
+
+@njit(cache=True, nogil=True, fastmath=True)
+def _fade(t):
+    """Perlin's quintic smoothstep 6t^5 - 15t^4 + 10t^3."""
+    return t * t * t * (t * (t * 6.0 - 15.0) + 10.0)
+
+
+# Gradient directions of noise.pnoise2: the x and y components of its 16-entry 3D GRAD3 table
+_GRAD_X = np.array([1, -1, 1, -1, 1, -1, 1, -1, 0, 0, 0, 0, 1, -1, 0, 0], dtype=np.float64)
+_GRAD_Y = np.array([1, 1, -1, -1, 0, 0, 0, 0, 1, -1, 1, -1, 0, 0, -1, 1], dtype=np.float64)
+
+
+@njit(cache=True, nogil=True, fastmath=True)
+def _grad(hash_val, x, y):
+    """Dot product of (x, y) with the gradient picked by the hash, as in noise.pnoise2."""
+    h = hash_val & 15
+    return x * _GRAD_X[h] + y * _GRAD_Y[h]
+
+
+@njit(cache=True, nogil=True, fastmath=True)
+def _perlin2(x, y, repeatx, repeaty):
+    """Single-octave 2D Perlin noise at (x, y), tiling every repeatx/repeaty units like noise.pnoise2."""
+    i = int(np.floor(np.fmod(x, repeatx)))
+    j = int(np.floor(np.fmod(y, repeaty)))
+    ii = int(np.fmod(i + 1, repeatx)) & 255
+    jj = int(np.fmod(j + 1, repeaty)) & 255
+    i &= 255
+    j &= 255
+    x -= np.floor(x)
+    y -= np.floor(y)
+    u = _fade(x)
+    v = _fade(y)
+
+    a = _PERM[i]
+    b = _PERM[ii]
+    aa = _PERM[_PERM[a + j]]
+    ab = _PERM[_PERM[a + jj]]
+    ba = _PERM[_PERM[b + j]]
+    bb = _PERM[_PERM[b + jj]]
+
+    x1 = _grad(aa, x, y) + u * (_grad(ba, x - 1.0, y) - _grad(aa, x, y))
+    x2 = _grad(ab, x, y - 1.0) + u * (_grad(bb, x - 1.0, y - 1.0) - _grad(ab, x, y - 1.0))
+    return x1 + v * (x2 - x1)
+
+
+@njit(cache=True, parallel=True, nogil=True, fastmath=True)
+def perlin_grid(xs, ys, octaves, persistence, lacunarity, repeatx, repeaty, out):
+    """Fill out[i, j] with fractal Perlin noise sampled at (xs[i], ys[j]), matching noise.pnoise2."""
+    for i in prange(xs.shape[0]):
+        x = xs[i]
+        for j in range(ys.shape[0]):
+            y = ys[j]
+            total = 0.0
+            amplitude = 1.0
+            frequency = 1.0
+            max_amplitude = 0.0
+            for _ in range(octaves):
+                total += _perlin2(x * frequency, y * frequency, repeatx * frequency, repeaty * frequency) * amplitude
+                max_amplitude += amplitude
+                amplitude *= persistence
+                frequency *= lacunarity
+            out[i, j] = total / max_amplitude
+    return out
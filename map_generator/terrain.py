@@ -1,9 +1,11 @@
 import numpy as np
-from noise import pnoise2
 import matplotlib.pyplot as plt
 from matplotlib.colors import ListedColormap
-import time
-import random
+from matplotlib.figure import Figure
+import os
+import tempfile
+
+from map_generator._noise_kernels import perlin_grid
 
 
 # Constants
@@ -15,29 +17,49 @@ SEA_LEVEL = 0  # Sea level in meters
 NORTH_TEMPERATURE = -10  # Approx winter temp in northern Europe
 SOUTH_TEMPERATURE = 30  # Approx summer temp in southern Europe
 
+# Water feature settings: noise scale and presence threshold per feature
+WATER_OCTAVES = 6
+LAKE_SCALE, LAKE_THRESHOLD = 0.05, 0.25
+RIVER_SCALE, RIVER_THRESHOLD = 0.02, 0.15
+VALLEY_THRESHOLD = 0.9  # 85% valleys, 15% desert
+
+# Part of every cache file name; bump it whenever a change alters the maps generated for a seed
+MAP_CACHE_VERSION = 1
+
+SEASONS = ('winter', 'spring', 'summer', 'fall')
+SEASON_TEMP_SHIFTS = {'winter': -15, 'spring': 0, 'summer': 15, 'fall': 0}  # °C added to the latitude baseline
+SEASON_LIGHT_HOURS = {'winter': 8, 'spring': 12, 'summer': 16, 'fall': 12}
+
+# One record per queried cell, holding every layer of that cell (see get_terrain_records)
+MAP_DTYPE = np.dtype(
+    [('height', 'f4'), ('water', 'f4')]
+    + [(f't_{season}', 'f4') for season in SEASONS]
+    + [(f'l_{season}', 'i1') for season in SEASONS]
+)
+
 def generate_base_map(width, height):
     """Generate a base map to initialize dimensions."""
-    return np.zeros((height, width))
+    return np.zeros((height, width), dtype=np.float32)
 
 
-def generate_height_map(width, height, scale=0.03, octaves=5, persistence=0.6, lacunarity=2.1, min_alt=-1000, max_alt=5000, sea_percentage=0.4):
+def generate_height_map(width, height, scale=0.03, octaves=5, persistence=0.6, lacunarity=2.1, min_alt=-1000, max_alt=5000, sea_percentage=0.4, rng=None):
     """Generate a height map using Perlin noise, scaled to have a specified percentage below sea level."""
-    height_map = np.zeros((height, width))
-
     # Randomize the base offsets for each generation
-    base_x = random.randint(0, 10000)
-    base_y = random.randint(0, 10000)
+    base_x, base_y = np.random.default_rng(rng).integers(0, 10000, size=2, endpoint=True)
 
-    for i in range(height):
-        for j in range(width):
-            # Adjust the noise coordinates by the randomized base offsets
-            altitude = pnoise2((i + base_x) * scale, (j + base_y) * scale, octaves=octaves, persistence=persistence, lacunarity=lacunarity, repeatx=width, repeaty=height)
-            # Scale noise output to altitude range
-            scaled_altitude = min_alt + (max_alt - min_alt) * (altitude + 1) / 2
-            height_map[i, j] = scaled_altitude
+    # Adjust the noise coordinates by the randomized base offsets
+    xs = (np.arange(height) + base_x) * scale
+    ys = (np.arange(width) + base_y) * scale
+    height_map = np.zeros((height, width), dtype=np.float32)
+    perlin_grid(xs, ys, octaves, persistence, lacunarity, width, height, height_map)
 
-    # Adjust sea level based on the desired sea percentage
-    sea_level = np.percentile(height_map, sea_percentage * 100)
+    # Scale noise output to altitude range
+    height_map = min_alt + (max_alt - min_alt) * (height_map + 1) / 2
+
+    # Adjust sea level based on the desired sea percentage, selecting the nearest-rank altitude in O(n)
+    flat = height_map.ravel()
+    k = round(sea_percentage * (flat.size - 1))
+    sea_level = np.partition(flat, k)[k]
     # Normalize height map so that the calculated sea level is at 0
     height_map -= sea_level
 
@@ -46,85 +68,126 @@ def generate_height_map(width, height, scale=0.03, octaves=5, persistence=0.6, l
 
 def generate_temperature_map(height_map, latitude_factor):
     """Generate temperature maps for each season affected by latitude and altitude."""
-    temp_maps = {}
-    lat_range = np.linspace(NORTH_TEMPERATURE, SOUTH_TEMPERATURE, height_map.shape[0])
-    for season, temp_shift in [('winter', -15), ('spring', 0), ('summer', 15), ('fall', 0)]:
-        temp_map = lat_range[:, np.newaxis] + temp_shift - 0.005 * height_map  # Decrease 0.5°C per 100m
-        # Round the temperatures to one decimal place
-        temp_map = np.round(temp_map, 1)
-        temp_maps[season] = temp_map
+    lat_range = np.linspace(NORTH_TEMPERATURE, SOUTH_TEMPERATURE, height_map.shape[0], dtype=np.float32)
+    temp_shifts = np.array([SEASON_TEMP_SHIFTS[season] for season in SEASONS], dtype=np.float32)[:, np.newaxis, np.newaxis]
+    height_map = height_map.astype(np.float32, copy=False)
+
+    # All seasons at once as a (season, row, column) tensor, decreasing 0.5°C per 100m
+    temp_maps = lat_range[np.newaxis, :, np.newaxis] + temp_shifts - np.float32(0.005) * height_map[np.newaxis, :, :]
+    # Round the temperatures to one decimal place
+    np.round(temp_maps, 1, out=temp_maps)
 
-    return temp_maps
+    # Per-season views share the tensor's memory
+    return {season: temp_maps[i] for i, season in enumerate(SEASONS)}
 
 
-def generate_water_features(width, height, scale, water_type):
+def generate_water_features(width, height, scale, water_type, rng=None):
     """Generate a noise map for water features."""
-    water_map = np.zeros((height, width))
-    base_x = int(time.time()) % 1000  # Changing base offsets dynamically
-    base_y = int(time.time()) % 1000  # Based on the current time
+    # Independent base offsets for each call, drawn from the given seed or Generator
+    base_x, base_y = np.random.default_rng(rng).integers(0, 1000, size=2)
+    xs = (np.arange(height) + base_x) * scale
+    ys = (np.arange(width) + base_y) * scale
 
-    for i in range(height):
-        for j in range(width):
-            noise_val = pnoise2((i + base_x) * scale, (j + base_y) * scale, octaves=6)
-            water_map[i, j] = noise_val
+    water_map = np.zeros((height, width), dtype=np.float32)
+    perlin_grid(xs, ys, WATER_OCTAVES, 0.5, 2.0, 1024, 1024, water_map)
     return water_map
 
-def generate_water_presence_map(height_map, sea_level=0):
+def generate_water_presence_map(height_map, sea_level=0, rng=None):
     """Generate a map of water presence as a percentage based on altitude and additional features."""
-    width, height = height_map.shape
-    water_presence_map = np.zeros_like(height_map)
-
-    lake_map = generate_water_features(width, height, scale=0.05, water_type='lake')
-    river_map = generate_water_features(width, height, scale=0.02, water_type='river')
-    
-    # Basic water presence from altitude
-    water_presence_map[height_map <= sea_level] = 100  # Sea
-    water_presence_map[(height_map > sea_level) & (height_map <= sea_level + 50)] = 80  # Near shore, potential for rivers
-    water_presence_map[(height_map > sea_level + 50) & (height_map <= sea_level + 100)] = 95  # Potential for swamps
+    height, width = height_map.shape
+    rng = np.random.default_rng(rng)
 
-    # Apply river map
-    river_threshold = 0.15  # Threshold for river presence
-    water_presence_map[(river_map > river_threshold) & (height_map > sea_level) & (height_map <= sea_level + 100)] = 80
-
-    # Apply lake map
-    lake_threshold = 0.25  # Threshold for lake presence
-    water_presence_map[(lake_map > lake_threshold) & (height_map > sea_level) & (height_map <= sea_level + 100)] = 100
+    lake_map = generate_water_features(width, height, scale=LAKE_SCALE, water_type='lake', rng=rng)
+    river_map = generate_water_features(width, height, scale=RIVER_SCALE, water_type='river', rng=rng)
 
     # Valleys and desert conditions
-    desert_map = np.random.rand(height, width)  # Random distribution for desert
-    valley_threshold = 0.9  # 85% valleys, 15% desert
-    desert_threshold = valley_threshold + 0.1
-
-    water_presence_map[(height_map > sea_level ) & (desert_map <= valley_threshold)] = np.random.randint(15, 26)  # Valley with some water presence
-    water_presence_map[(height_map > sea_level + 2300) & (desert_map > valley_threshold*.8)] = np.random.randint(5, 16)  # Desert with low water presence
+    desert_map = rng.random((height, width))  # Random distribution for desert
+
+    # Altitude bands shared by several conditions, each computed once
+    above_sea = height_map > sea_level
+    shore = above_sea & (height_map <= sea_level + 50)
+    lowland = above_sea & (height_map <= sea_level + 100)
+    highland = height_map > sea_level + 2300
+
+    # Ordered from highest to lowest priority, as np.select keeps the first match
+    conditions = [
+        highland & (desert_map > VALLEY_THRESHOLD*.8),  # Desert with low water presence
+        above_sea & (desert_map <= VALLEY_THRESHOLD),  # Valley with some water presence
+        lowland & (lake_map > LAKE_THRESHOLD),  # Apply lake map
+        lowland & (river_map > RIVER_THRESHOLD),  # Apply river map
+        lowland & ~shore,  # Potential for swamps
+        shore,  # Near shore, potential for rivers
+        ~above_sea,  # Sea
+    ]
+    choices = [
+        rng.integers(5, 16, size=height_map.shape, dtype=np.int8),
+        rng.integers(15, 26, size=height_map.shape, dtype=np.int8),
+        100,
+        80,
+        95,
+        80,
+        100,
+    ]
+    water_presence_map = np.select(conditions, choices, default=np.float32(0))
 
     return water_presence_map
 
 
-def generate_light_map(latitude_factor):
+def generate_light_map(latitude_factor, shape=(HEIGHT, WIDTH)):
     """Generate light levels for each season, considering latitude."""
     light_maps = {}
-    for season, light_hours in [('winter', 8), ('spring', 12), ('summer', 16), ('fall', 12)]:
+    for season in SEASONS:
+        light_hours = SEASON_LIGHT_HOURS[season]
         # Simulate longer days in the north during summer and shorter during winter
-        light_map = np.full((HEIGHT, WIDTH), light_hours)
+        # A read-only zero-stride view: every cell shares the single stored value
+        light_map = np.broadcast_to(np.array(light_hours, dtype=np.int8), shape)
         light_maps[season] = light_map
     return light_maps
 
-def generate_comprehensive_map():
-    """Generate a comprehensive map with all required properties."""
+def generate_comprehensive_map(seed=None, width=WIDTH, height=HEIGHT, cache_dir=None):
+    """Generate a comprehensive map with all required properties, reusing a cached .npz for a known integer seed."""
+    cache_path = None
+    # Only integer seeds identify a map; Generators and SeedSequences have no stable key
+    if cache_dir is not None and isinstance(seed, (int, np.integer)):
+        cache_path = os.path.join(cache_dir, f"map_v{MAP_CACHE_VERSION}_{int(seed)}_{width}x{height}.npz")
+        if os.path.exists(cache_path):
+            comprehensive_map = load_detailed_map_npz(cache_path)
+            print("Sea level altitude:", comprehensive_map['sea_level'])
+            return comprehensive_map
+
+    rng = np.random.default_rng(seed)
     #base_map = generate_base_map(WIDTH, HEIGHT)
-    height_map, sea_level = generate_height_map(WIDTH, HEIGHT)
+    height_map, sea_level = generate_height_map(width, height, rng=rng)
     print("Sea level altitude:", sea_level)
     temperature_maps = generate_temperature_map(height_map, latitude_factor=0.5)
-    water_presence_map = generate_water_presence_map(height_map)
-    light_maps = generate_light_map(latitude_factor=0.5)
-    
-    return {
+    water_presence_map = generate_water_presence_map(height_map, rng=rng)
+    light_maps = generate_light_map(latitude_factor=0.5, shape=(height, width))
+    comprehensive_map = _assemble_map(height_map, water_presence_map, temperature_maps, light_maps, sea_level)
+
+    if cache_path is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        # Write to a temporary file and rename it, so a concurrent or interrupted run never sees a partial cache file
+        with tempfile.NamedTemporaryFile(dir=cache_dir, suffix='.npz', delete=False) as tmp_file:
+            try:
+                save_detailed_map_npz(comprehensive_map, tmp_file)
+            except BaseException:
+                os.remove(tmp_file.name)
+                raise
+        os.replace(tmp_file.name, cache_path)
+    return comprehensive_map
+
+
+def _assemble_map(height_map, water_presence_map, temperature_maps, light_maps, sea_level=None):
+    """Bundle the map layers into the comprehensive map dictionary."""
+    comprehensive_map = {
         'height': height_map,
         'temperature': temperature_maps,
         'water_presence': water_presence_map,
         'light': light_maps
     }
+    if sea_level is not None:
+        comprehensive_map['sea_level'] = sea_level
+    return comprehensive_map
 
 
 
@@ -138,20 +201,75 @@ def get_terrain_info(comprehensive_map, x, y):
     }
     return info
 
-def save_detailed_map(comprehensive_map, file_path="detailed_map.txt"):
-    """Save detailed map information to a file."""
+def get_terrain_records(comprehensive_map, xs, ys):
+    """Gather every layer for many coordinates at once into a MAP_DTYPE record array shaped like xs."""
+    records = np.empty(np.broadcast(xs, ys).shape, dtype=MAP_DTYPE)
+    records['height'] = comprehensive_map['height'][ys, xs]
+    records['water'] = comprehensive_map['water_presence'][ys, xs]
+    for season in SEASONS:
+        records[f't_{season}'] = comprehensive_map['temperature'][season][ys, xs]
+        records[f'l_{season}'] = comprehensive_map['light'][season][ys, xs]
+    return records
+
+def _format_layer(layer):
+    """Format every value of a layer as str() would format its NumPy scalar."""
+    if layer.dtype == np.float64 or layer.dtype.kind in 'iu':
+        # Python ints and floats print identically and convert faster
+        return map(str, layer.ravel().tolist())
+    return layer.ravel().astype(str).tolist()
+
+def save_detailed_map(comprehensive_map, file_path=None, format="text"):
+    """Save detailed map information to a file, as text lines or ("npz") compressed arrays."""
+    if format == "npz":
+        return save_detailed_map_npz(comprehensive_map, file_path or "map.npz")
+    if format != "text":
+        raise ValueError(f"Unknown map format: {format!r}")
+    file_path = file_path or "detailed_map.txt"
+
+    row_format = ("{},{},Height:{},Water:{}%,"
+                  + ','.join(f"{season} Temp:{{}}" for season in SEASONS)
+                  + ','.join(f"{season} Light:{{}}" for season in SEASONS))
+
+    # Gather every cell as a record, format each field to strings in one pass, then assemble the rows
+    i_coords, j_coords = np.indices(comprehensive_map['height'].shape)
+    records = get_terrain_records(comprehensive_map, j_coords, i_coords)
+    columns = [_format_layer(i_coords), _format_layer(j_coords)]
+    columns += [_format_layer(records[name]) for name in MAP_DTYPE.names]
+    rows = "\n".join(row_format.format(*row) for row in zip(*columns))
+
     with open(file_path, "w") as file:
-        for i in range(comprehensive_map['height'].shape[0]):
-            for j in range(comprehensive_map['height'].shape[1]):
-                file.write(f"{i},{j},Height:{comprehensive_map['height'][i, j]},")
-                file.write(f"Water:{comprehensive_map['water_presence'][i, j]}%,")
-                file.write(','.join([f"{season} Temp:{comprehensive_map['temperature'][season][i, j]}" for season in comprehensive_map['temperature']]))
-                file.write(','.join([f"{season} Light:{comprehensive_map['light'][season][i, j]}" for season in comprehensive_map['light']]))
-                file.write('\n')
-
-def plot_maps(comprehensive_map):
-    """Plot all layers of the map including the water presence map with percentages."""
-    fig, axs = plt.subplots(1, 3, figsize=(18, 6))  # Setting up a 1x3 grid of plots
+        file.write(rows + "\n")
+
+def save_detailed_map_npz(comprehensive_map, file_path="map.npz"):
+    """Save the map layers as compressed NumPy arrays, seasons stacked along the first axis."""
+    extra = {'sea_level': comprehensive_map['sea_level']} if 'sea_level' in comprehensive_map else {}
+    np.savez_compressed(
+        file_path,
+        **extra,
+        seasons=np.array(SEASONS),
+        height=comprehensive_map['height'],
+        water_presence=comprehensive_map['water_presence'],
+        temperature=np.stack([comprehensive_map['temperature'][season] for season in SEASONS]),
+        light=np.stack([comprehensive_map['light'][season] for season in SEASONS])
+    )
+
+def load_detailed_map_npz(file_path="map.npz"):
+    """Load a map written by save_detailed_map_npz back into a comprehensive map."""
+    with np.load(file_path) as data:
+        seasons = data['seasons'].tolist()
+        return _assemble_map(
+            data['height'],
+            data['water_presence'],
+            dict(zip(seasons, data['temperature'])),
+            dict(zip(seasons, data['light'])),
+            data['sea_level'][()] if 'sea_level' in data else None
+        )
+
+def plot_maps(comprehensive_map, out_path=None):
+    """Plot all layers of the map including the water presence map with percentages, saving to out_path if given."""
+    # A bare Figure renders through Agg, so headless and worker-process runs skip GUI initialization
+    fig = Figure(figsize=(18, 6)) if out_path else plt.figure(figsize=(18, 6))
+    axs = fig.subplots(1, 3)  # Setting up a 1x3 grid of plots
 
     # Plotting the height map
     im = axs[0].imshow(comprehensive_map['height'], cmap='terrain')
@@ -170,8 +288,11 @@ def plot_maps(comprehensive_map):
     axs[2].set_title('Summer Temperature Map')
     fig.colorbar(im, ax=axs[2], fraction=0.046, pad=0.04)
 
-    plt.tight_layout()  # Adjust the layout to make room for all plot elements
-    plt.show()
+    fig.tight_layout()  # Adjust the layout to make room for all plot elements
+    if out_path:
+        fig.savefig(out_path, dpi=120)
+    else:
+        plt.show()
 
 # Assuming comprehensive_map has been populated with necessary data
 # comprehensive_map = {